@@ -4,6 +4,7 @@ import streamlit as st
 from src.video_processor import VideoProcessor
 import tempfile
 import os
+import re
 import cv2
 
 st.set_page_config(layout="wide", page_title="Group Analysis AI")
@@ -16,6 +17,15 @@ output_dir = "output"
 output_frames_dir = os.path.join(output_dir, "saved_frames")
 os.makedirs(output_frames_dir, exist_ok=True)
 
+_GROUP_ID_RE = re.compile(r'_group_(\d+)\.jpg$')
+
+
+@st.cache_data(ttl=5)
+def list_snapshots(frames_dir):
+    """Sorted snapshot filenames, cached so Streamlit reruns don't hit the
+    filesystem every time."""
+    return sorted(os.listdir(frames_dir))
+
 # --- UI for File Upload ---
 uploaded_file = st.file_uploader("Choose a video file", type=["mp4", "mov", "avi"])
 
@@ -40,11 +50,15 @@ if uploaded_file is not None:
         progress_bar = st.progress(0)
         st_frame = st.empty()
 
-        # Process video and display frames in real-time
-        for annotated_frame, progress in processor.process_video_and_yield_frames(source_video_path):
+        # Process video and display frames in real-time. st.image blocks on a
+        # websocket write, so only push every 5th frame to the preview - the
+        # progress bar still updates on every frame.
+        for frame_index, (annotated_frame, progress) in enumerate(processor.process_video_and_yield_frames(source_video_path)):
             progress_bar.progress(progress)
-            # Convert color from BGR (OpenCV) to RGB (Streamlit)
-            st_frame.image(cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB), channels="RGB")
+            if frame_index % 5 == 0:
+                # Reversing the channel axis gives an RGB view without
+                # copying, unlike cv2.cvtColor
+                st_frame.image(annotated_frame[..., ::-1], channels="RGB")
 
         progress_bar.progress(1.0)
         st.success("Processing Complete!")
@@ -64,7 +78,7 @@ if uploaded_file is not None:
 
         # Display some of the saved snapshot images
         st.subheader("Saved Snapshots")
-        snapshot_files = sorted(os.listdir(output_frames_dir))
+        snapshot_files = list_snapshots(output_frames_dir)
         if snapshot_files:
             # Display up to 5 snapshots
             for snapshot in snapshot_files[:5]:
@@ -73,39 +87,37 @@ if uploaded_file is not None:
             st.write("No snapshots were saved during this run.")
 
 # Display snapshots with filtering options (moved outside the upload block)
-if os.path.exists(output_frames_dir) and os.listdir(output_frames_dir):
+snapshot_files = list_snapshots(output_frames_dir) if os.path.exists(output_frames_dir) else []
+if snapshot_files:
     st.subheader("Saved Snapshots")
-    snapshot_files = sorted(os.listdir(output_frames_dir))
-    
+
     col1, col2 = st.columns(2)
-    
+
     with col1:
         display_option = st.selectbox(
             "Display Mode",
             ["Latest 5 Snapshots", "All Snapshots", "Group-specific Snapshots"]
         )
-    
+
     with col2:
         if display_option == "Group-specific Snapshots":
-            # Extract unique group IDs from filenames
-            group_ids = sorted(set(
-                int(f.split('_group_')[1].split('.')[0]) 
-                for f in snapshot_files 
-                if '_group_' in f
-            ))
+            # Extract unique group IDs from filenames in a single regex pass
+            group_ids = sorted({
+                int(m.group(1))
+                for m in map(_GROUP_ID_RE.search, snapshot_files) if m
+            })
             selected_group = st.selectbox("Select Group ID", group_ids)
             snapshots_to_display = [f for f in snapshot_files if f"group_{selected_group}" in f]
         else:
             snapshots_to_display = snapshot_files[-5:] if display_option == "Latest 5 Snapshots" else snapshot_files
 
-    # Display snapshots in a grid
-    cols = st.columns(3)
-    for idx, snapshot in enumerate(snapshots_to_display):
-        with cols[idx % 3]:
-            st.image(
-                os.path.join(output_frames_dir, snapshot),
-                caption=f"Frame: {snapshot.split('_')[1]}",
-                use_container_width=True  # Updated from use_column_width
-            )
+    # One multi-image call serializes the batch in a single pass instead of
+    # one round-trip per image
+    if snapshots_to_display:
+        st.image(
+            [os.path.join(output_frames_dir, snapshot) for snapshot in snapshots_to_display],
+            caption=[f"Frame: {snapshot.split('_')[1]}" for snapshot in snapshots_to_display],
+            use_container_width=True  # Updated from use_column_width
+        )
 else:
     st.write("No snapshots were saved during this run.")
\ No newline at end of file